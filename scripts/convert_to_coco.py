@@ -17,55 +17,46 @@ Examples:
 
 import argparse
 import json
-from dataclasses import dataclass
+import os
+import struct
+import warnings
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
 from PIL import Image
 
-
-@dataclass(frozen=True)
-class CocoImage:
-    """COCO "images" entry.
-
-    Attributes:
-        id: Unique integer id for the image.
-        file_name: Basename of the image file.
-        width: Image width in pixels.
-        height: Image height in pixels.
-        license: License id (defaults to 1: CC BY 4.0).
-        date_captured: ISO-like capture date string.
-    """
-
-    id: int
-    file_name: str
-    width: int
-    height: int
-    license: int = 1
-    date_captured: str = "2024-04-12"
-
-
-@dataclass(frozen=True)
-class CocoAnnotation:
-    """COCO "annotations" entry (bbox-only).
-
-    Attributes:
-        id: Unique integer id for the annotation.
-        image_id: Image id that this annotation belongs to.
-        category_id: Category id (1 for apples in this dataset).
-        bbox: COCO bbox [x, y, width, height] in pixels.
-        area: Area in pixels^2.
-        iscrowd: Whether this is a crowd region (0 or 1).
-        segmentation: Empty list for bbox-only annotations.
-    """
-
-    id: int
-    image_id: int
-    category_id: int
-    bbox: List[float]
-    area: float
-    iscrowd: int = 0
-    segmentation: Optional[List[List[float]]] = None
+try:
+    import orjson
+except ImportError:  # optional, only speeds up JSON serialization
+    orjson = None
+
+# Start-of-frame markers carrying the frame size (excludes DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Images whose boxes are converted together in one vectorized pass
+_ANNOTATION_BATCH_IMAGES = 256
+
+# json.dumps(..., indent=2) builds a new encoder on every call; reuse one instead
+_JSON_ENCODER = json.JSONEncoder(indent=2)
+
+# Static COCO blocks shared by every exported file
+_COCO_INFO: Dict[str, object] = {
+    "description": "AppleBBCH81 Dataset - Apple fruit images for object detection",
+    "version": "1.0",
+    "year": 2024,
+    "contributor": "Project LZP",
+    "date_created": "2024-04-12",
+    "url": "",
+}
+_COCO_LICENSES: List[Dict[str, object]] = [
+    {"id": 1, "name": "CC BY 4.0", "url": "https://creativecommons.org/licenses/by/4.0/"}
+]
+_COCO_CATEGORIES: List[Dict[str, object]] = [
+    {"id": 1, "name": "apple", "supercategory": "fruit"}
+]
 
 
 def _read_split_file(path: Path) -> List[str]:
@@ -83,8 +74,71 @@ def _read_split_file(path: Path) -> List[str]:
     return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
 
 
+def _fast_jpeg_size(fp: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the SOF segment of a JPEG header.
+
+    Walks the marker segments up to the first start-of-frame marker without
+    decoding any image data.
+
+    Args:
+        fp: JPEG file opened in binary mode, positioned at its start.
+
+    Returns:
+        Tuple of (width, height) in pixels, or None if the header cannot be parsed.
+    """
+
+    if fp.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        byte = fp.read(1)
+        if byte != b"\xff":
+            return None
+        # Markers may be preceded by any number of 0xFF fill bytes
+        while byte == b"\xff":
+            byte = fp.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # standalone markers carry no length
+        if marker in (0xD9, 0xDA):
+            return None  # end of image / start of scan before any SOF
+        header = fp.read(2)
+        if len(header) != 2:
+            return None
+        (length,) = struct.unpack(">H", header)
+        if marker in _JPEG_SOF_MARKERS:
+            frame = fp.read(5)
+            if len(frame) != 5:
+                return None
+            height, width = struct.unpack(">xHH", frame)
+            return (width, height) if width and height else None
+        fp.seek(length - 2, os.SEEK_CUR)
+
+
+def _fast_png_size(fp: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the IHDR chunk of a PNG header.
+
+    Args:
+        fp: PNG file opened in binary mode, positioned at its start.
+
+    Returns:
+        Tuple of (width, height) in pixels, or None if the header cannot be parsed.
+    """
+
+    head = fp.read(24)
+    if len(head) != 24 or head[:8] != _PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", head[16:24])
+    return width, height
+
+
 def _image_size(image_path: Path) -> Tuple[int, int]:
-    """Return (width, height) for an image path using PIL.
+    """Return (width, height) for an image path.
+
+    JPEG and PNG sizes are read straight from the file header; PIL is only
+    used for other formats or when the header cannot be parsed, and reuses the
+    already open file.
 
     Args:
         image_path: Path to an image file.
@@ -93,24 +147,31 @@ def _image_size(image_path: Path) -> Tuple[int, int]:
         Tuple of (width, height) in pixels.
     """
 
-    with Image.open(image_path) as img:
-        return img.width, img.height
+    suffix = image_path.suffix.lower()
+    with open(image_path, "rb") as fp:
+        size: Optional[Tuple[int, int]] = None
+        if suffix in (".jpg", ".jpeg"):
+            size = _fast_jpeg_size(fp)
+        elif suffix == ".png":
+            size = _fast_png_size(fp)
+        if size is not None:
+            return size
 
+        fp.seek(0)
+        with Image.open(fp) as img:
+            return img.width, img.height
 
-def _read_yolo_labels(label_path: Path) -> List[Tuple[int, float, float, float, float]]:
-    """Parse a YOLO label file.
 
-    Each line is: "class x_center y_center width height" (all normalized 0..1).
+def _parse_yolo_lines(label_path: Path) -> np.ndarray:
+    """Parse a YOLO label file line by line, skipping malformed lines.
 
     Args:
         label_path: Path to a .txt label file.
 
     Returns:
-        A list of tuples (class_id, xc, yc, w, h).
+        A float64 array of shape (N, 5) with columns (class_id, xc, yc, w, h).
     """
 
-    if not label_path.exists():
-        return []
     rows: List[Tuple[int, float, float, float, float]] = []
     for raw in label_path.read_text(encoding="utf-8").splitlines():
         raw = raw.strip()
@@ -128,72 +189,286 @@ def _read_yolo_labels(label_path: Path) -> List[Tuple[int, float, float, float,
         except ValueError:
             continue
         rows.append((cls, xc, yc, w, h))
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def _read_yolo_labels(label_path: Path) -> np.ndarray:
+    """Parse a YOLO label file.
+
+    Each line is: "class x_center y_center width height" (all normalized 0..1).
+    Well-formed files are parsed in one pass by `np.loadtxt`; files with
+    malformed lines fall back to `_parse_yolo_lines`.
+
+    Args:
+        label_path: Path to an existing .txt label file.
+
+    Returns:
+        A float64 array of shape (N, 5) with columns (class_id, xc, yc, w, h).
+    """
+
+    try:
+        with warnings.catch_warnings():
+            # Empty label files are valid (image without apples)
+            warnings.simplefilter("ignore", UserWarning)
+            # comments=None: a trailing "# ..." makes the line malformed, as in _parse_yolo_lines
+            rows = np.loadtxt(label_path, dtype=np.float64, ndmin=2, comments=None)
+    except ValueError:
+        return _parse_yolo_lines(label_path)
+    if rows.size == 0:
+        return np.empty((0, 5), dtype=np.float64)
+    if rows.shape[1] != 5:
+        return _parse_yolo_lines(label_path)
     return rows
 
 
-def _yolo_to_coco_bbox(
-    xc: float, yc: float, w: float, h: float, width_px: int, height_px: int
-) -> Tuple[float, float, float, float]:
-    """Convert YOLO normalized bbox to COCO pixel bbox.
+def _yolo_to_coco_bboxes(
+    rows: np.ndarray, width_px: np.ndarray, height_px: np.ndarray
+) -> np.ndarray:
+    """Convert YOLO normalized bboxes to COCO pixel bboxes.
 
     Args:
-        xc: Center x (0..1)
-        yc: Center y (0..1)
-        w: Width (0..1)
-        h: Height (0..1)
-        width_px: Image width in pixels
-        height_px: Image height in pixels
+        rows: Array of shape (N, 5) with columns (class_id, xc, yc, w, h), normalized 0..1.
+        width_px: Array of shape (N,) with the width in pixels of each row's image
+        height_px: Array of shape (N,) with the height in pixels of each row's image
 
     Returns:
-        (x, y, width, height) in pixels.
+        Array of shape (N, 4) with columns (x, y, width, height) in pixels.
     """
 
-    width = w * width_px
-    height = h * height_px
-    x = (xc * width_px) - (width / 2.0)
-    y = (yc * height_px) - (height / 2.0)
-    return x, y, width, height
+    boxes = rows[:, 1:] * np.column_stack((width_px, height_px, width_px, height_px))
+    boxes[:, :2] -= boxes[:, 2:] / 2.0
+    return boxes
 
 
 def _build_coco_dict() -> Dict[str, object]:
-    """Create a fresh COCO dictionary skeleton for AppleBBCH81."""
+    """Create a COCO dictionary skeleton for AppleBBCH81.
+
+    The top-level dict and its images/annotations lists are fresh; the
+    info/licenses/categories blocks are shared module constants and must not
+    be mutated.
+    """
 
     return {
-        "info": {
-            "description": "AppleBBCH81 Dataset - Apple fruit images for object detection",
-            "version": "1.0",
-            "year": 2024,
-            "contributor": "Project LZP",
-            "date_created": "2024-04-12",
-            "url": "",
-        },
-        "licenses": [
-            {"id": 1, "name": "CC BY 4.0", "url": "https://creativecommons.org/licenses/by/4.0/"}
-        ],
+        "info": _COCO_INFO,
+        "licenses": _COCO_LICENSES,
         "images": [],
         "annotations": [],
-        "categories": [
-            {"id": 1, "name": "apple", "supercategory": "fruit"}
-        ],
+        "categories": _COCO_CATEGORIES,
     }
 
 
-def _collect_image_paths(images_dir: Path, stems: Optional[Sequence[str]] = None) -> List[Path]:
+def _index_images(images_dir: Path) -> Dict[str, Path]:
+    """Map image stems to paths for every image in a directory.
+
+    Args:
+        images_dir: Directory containing images.
+
+    Returns:
+        Dict of {stem: path}, in order of file name. Empty if the directory
+        does not exist.
+    """
+
+    # normcase keeps the suffix match case-insensitive on Windows, like Path.glob
+    try:
+        with os.scandir(images_dir) as entries:
+            names = sorted(
+                entry.name for entry in entries if os.path.normcase(entry.name).endswith(".jpg")
+            )
+    except FileNotFoundError:
+        return {}
+    return {name[:-4]: images_dir / name for name in names}
+
+
+def _collect_image_paths(
+    images_dir: Path,
+    stems: Optional[Sequence[str]] = None,
+    index: Optional[Dict[str, Path]] = None,
+) -> List[Path]:
     """Collect image paths by optional list of stems.
 
     Args:
         images_dir: Directory containing images.
         stems: Image base names (without extension) to include. If None, include all images.
+        index: Optional {stem: path} map from `_index_images`, to avoid rescanning
+            `images_dir` when collecting several splits.
 
     Returns:
         List of image paths sorted by name.
     """
 
-    candidates = sorted([p for p in images_dir.glob("*.jpg")])
+    if index is None:
+        index = _index_images(images_dir)
     if stems is None:
-        return candidates
-    stem_set = set(stems)
-    return [p for p in candidates if p.stem in stem_set]
+        return list(index.values())
+    return sorted(index[stem] for stem in set(stems) if stem in index)
+
+
+def _index_labels(labels_dir: Path) -> Dict[str, Path]:
+    """Map label stems to paths for every YOLO label file in a directory.
+
+    Stems are passed through `os.path.normcase`, so on case-insensitive
+    platforms "x.TXT" or "X.txt" is found for image "x", as
+    `Path.exists()` would.
+
+    Args:
+        labels_dir: Directory with YOLO .txt label files.
+
+    Returns:
+        Dict of {normcased stem: path}, where path uses the real file name.
+        Empty if the directory does not exist.
+    """
+
+    index: Dict[str, Path] = {}
+    try:
+        with os.scandir(labels_dir) as entries:
+            for entry in entries:
+                name = os.path.normcase(entry.name)
+                if name.endswith(".txt"):
+                    index[name[:-4]] = labels_dir / entry.name
+    except FileNotFoundError:
+        pass
+    return index
+
+
+def _process_image(
+    image_path: Path, label_path: Optional[Path]
+) -> Tuple[int, int, np.ndarray]:
+    """Read the size and YOLO rows of a single image.
+
+    This is the per-image unit of work handed to worker processes; it is
+    stateless so that ids can be assigned in order by the caller.
+
+    Args:
+        image_path: Path to an image file.
+        label_path: Path to its YOLO .txt label file, or None if it has none.
+
+    Returns:
+        Tuple of (width, height, rows) where rows is an (N, 5) array of
+        (class_id, xc, yc, w, h).
+    """
+
+    width, height = _image_size(image_path)
+    if label_path is None:
+        return width, height, np.empty((0, 5), dtype=np.float64)
+    return width, height, _read_yolo_labels(label_path)
+
+
+def _iter_annotations(
+    results: Sequence[Tuple[int, int, np.ndarray]]
+) -> Iterator[Dict[str, object]]:
+    """Yield COCO annotation entries for per-image results, in image order.
+
+    Boxes are stacked and converted in one vectorized pass per batch of
+    `_ANNOTATION_BATCH_IMAGES` images, so memory stays bounded while entries
+    are written. Ids are assigned sequentially here so the output does not
+    depend on how the per-image work was scheduled.
+
+    Args:
+        results: (width, height, rows) tuples as returned by `_process_image`.
+
+    Yields:
+        COCO "annotations" entries.
+    """
+
+    next_ann_id = 1
+    for start in range(0, len(results), _ANNOTATION_BATCH_IMAGES):
+        batch = results[start : start + _ANNOTATION_BATCH_IMAGES]
+        counts = [len(rows) for _, _, rows in batch]
+        rows = np.concatenate([rows for _, _, rows in batch])
+        sizes = np.repeat(
+            np.array([(width, height) for width, height, _ in batch], dtype=np.float64),
+            counts,
+            axis=0,
+        )
+        image_ids = np.repeat(np.arange(start + 1, start + len(batch) + 1), counts)
+
+        boxes = _yolo_to_coco_bboxes(rows, sizes[:, 0], sizes[:, 1])
+        areas = boxes[:, 2] * boxes[:, 3]
+        for img_id, bbox, area in zip(image_ids.tolist(), boxes.tolist(), areas.tolist()):
+            # Normalize class id to 1 (apple)
+            category_id = 1
+            yield {
+                "id": next_ann_id,
+                "image_id": img_id,
+                "category_id": category_id,
+                "bbox": bbox,
+                "area": area,
+                "iscrowd": 0,
+                "segmentation": [],
+            }
+            next_ann_id += 1
+
+
+def _indent_json(obj: object, level: int) -> bytes:
+    """Serialize `obj` with indent=2 as if it were nested `level` spaces deep.
+
+    Uses orjson when it is installed and falls back to the stdlib json module.
+    Both produce the same layout and JSON values, but not always the same bytes:
+    orjson writes non-ASCII text as raw UTF-8, uses a different float exponent
+    format (e.g. 1e-5 vs 1e-05) and writes NaN/Infinity as null.
+    """
+
+    if orjson is not None:
+        text = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    else:
+        text = _JSON_ENCODER.encode(obj).encode("utf-8")
+    return text.replace(b"\n", b"\n" + b" " * level)
+
+
+def _write_json_array(fp: BinaryIO, records: Iterable[object], level: int) -> int:
+    """Write `records` as an indented JSON array, one record at a time.
+
+    Args:
+        fp: Binary file to write to.
+        records: Items of the array; consumed lazily.
+        level: Indentation (in spaces) of the line holding the opening bracket.
+
+    Returns:
+        Number of records written.
+    """
+
+    pad = b"\n" + b" " * (level + 2)
+    written = 0
+    fp.write(b"[")
+    for record in records:
+        fp.write((b"," if written else b"") + pad + _indent_json(record, level + 2))
+        written += 1
+    fp.write((b"\n" + b" " * level + b"]") if written else b"]")
+    return written
+
+
+def _write_coco_json(
+    out_json: Path, images: Iterable[Dict[str, object]], annotations: Iterable[Dict[str, object]]
+) -> Tuple[int, int]:
+    """Stream a COCO JSON file to disk without building it in memory.
+
+    Images and annotations are serialized one entry at a time. With the stdlib
+    json fallback the text is identical to `json.dumps(coco, indent=2)` of the
+    full dictionary; with orjson it holds the same JSON values (see
+    `_indent_json` for where the bytes can differ).
+
+    Args:
+        out_json: Output JSON path.
+        images: COCO "images" entries.
+        annotations: COCO "annotations" entries; consumed after all images.
+
+    Returns:
+        Tuple of (number of images, number of annotations) written.
+    """
+
+    coco = _build_coco_dict()
+    streamed = {"images": images, "annotations": annotations}
+    counts: Dict[str, int] = {}
+    with out_json.open("wb") as fp:
+        fp.write(b"{")
+        for i, (key, value) in enumerate(coco.items()):
+            fp.write((b"," if i else b"") + b"\n  " + _indent_json(key, 2) + b": ")
+            if key in streamed:
+                counts[key] = _write_json_array(fp, streamed[key], level=2)
+            else:
+                fp.write(_indent_json(value, 2))
+        fp.write(b"\n}")
+    return counts["images"], counts["annotations"]
 
 
 def convert_to_coco(
@@ -201,6 +476,9 @@ def convert_to_coco(
     labels_dir: Path,
     out_json: Path,
     stems: Optional[Sequence[str]] = None,
+    executor: Optional[Executor] = None,
+    index: Optional[Dict[str, Path]] = None,
+    label_index: Optional[Dict[str, Path]] = None,
 ) -> None:
     """Convert YOLO annotations to COCO JSON for a set of images.
 
@@ -209,65 +487,41 @@ def convert_to_coco(
         labels_dir: Directory with YOLO .txt label files.
         out_json: Output JSON path.
         stems: Optional list of image stems to restrict conversion.
+        executor: Optional executor (e.g. a ProcessPoolExecutor shared between
+            calls) to run the per-image work on. If None, runs in-process.
+        index: Optional {stem: path} map of `images_dir` shared between calls.
+        label_index: Optional {normcased stem: path} map of `labels_dir` from
+            `_index_labels`, shared between calls.
     """
 
-    coco = _build_coco_dict()
-    images: List[CocoImage] = []
-    annotations: List[CocoAnnotation] = []
-
-    image_paths = _collect_image_paths(images_dir, stems)
+    image_paths = _collect_image_paths(images_dir, stems, index)
     print(f"Found {len(image_paths)} images to convert from {images_dir}")
 
-    next_ann_id = 1
-    for img_id, path in enumerate(image_paths, start=1):
-        width, height = _image_size(path)
-        images.append(
-            CocoImage(
-                id=img_id,
-                file_name=path.name,
-                width=width,
-                height=height,
-            )
-        )
+    if label_index is None:
+        label_index = _index_labels(labels_dir)
+    label_paths = [label_index.get(os.path.normcase(path.stem)) for path in image_paths]
 
-        lbl = labels_dir / f"{path.stem}.txt"
-        rows = _read_yolo_labels(lbl)
-        for cls, xc, yc, w, h in rows:
-            # Normalize class id to 1 (apple)
-            category_id = 1
-            x, y, ww, hh = _yolo_to_coco_bbox(xc, yc, w, h, width, height)
-            annotations.append(
-                CocoAnnotation(
-                    id=next_ann_id,
-                    image_id=img_id,
-                    category_id=category_id,
-                    bbox=[x, y, ww, hh],
-                    area=ww * hh,
-                    iscrowd=0,
-                    segmentation=[],
-                )
-            )
-            next_ann_id += 1
+    if executor is not None and len(image_paths) > 1:
+        results = list(executor.map(_process_image, image_paths, label_paths, chunksize=32))
+    else:
+        results = [_process_image(path, lbl) for path, lbl in zip(image_paths, label_paths)]
 
-    # Dump
-    coco["images"] = [image.__dict__ for image in images]
-    coco["annotations"] = [
+    images = (
         {
-            "id": ann.id,
-            "image_id": ann.image_id,
-            "category_id": ann.category_id,
-            "bbox": ann.bbox,
-            "area": ann.area,
-            "iscrowd": ann.iscrowd,
-            "segmentation": ann.segmentation if ann.segmentation is not None else [],
+            "id": img_id,
+            "file_name": path.name,
+            "width": width,
+            "height": height,
+            "license": 1,
+            "date_captured": "2024-04-12",
         }
-        for ann in annotations
-    ]
+        for img_id, (path, (width, height, _)) in enumerate(zip(image_paths, results), start=1)
+    )
 
     out_json.parent.mkdir(parents=True, exist_ok=True)
-    out_json.write_text(json.dumps(coco, indent=2), encoding="utf-8")
+    num_images, num_annotations = _write_coco_json(out_json, images, _iter_annotations(results))
     print(
-        f"Saved COCO JSON with {len(images)} images and {len(annotations)} annotations to {out_json}"
+        f"Saved COCO JSON with {num_images} images and {num_annotations} annotations to {out_json}"
     )
 
 
@@ -309,17 +563,45 @@ def main() -> None:
         default=Path("sets"),
         help="Directory containing split files like train.txt, val.txt, test.txt.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: CPU count; 1 disables multiprocessing).",
+    )
 
     args = parser.parse_args()
 
     if args.splits:
-        for split in args.splits:
-            stems = _read_split_file(args.split_dir / f"{split}.txt")
-            out_path = args.out / f"applebbch81_instances_{split}.json"
-            convert_to_coco(args.images, args.labels, out_path, stems)
+        exports = [
+            (
+                _read_split_file(args.split_dir / f"{split}.txt"),
+                args.out / f"applebbch81_instances_{split}.json",
+            )
+            for split in args.splits
+        ]
     else:
-        out_path = args.out / "applebbch81_instances_all.json"
-        convert_to_coco(args.images, args.labels, out_path, stems=None)
+        exports = [(None, args.out / "applebbch81_instances_all.json")]
+
+    index = _index_images(args.images)
+    label_index = _index_labels(args.labels)
+    workers = args.workers if args.workers is not None else (os.cpu_count() or 1)
+    # One pool for all splits so workers are started (and import numpy/PIL) only once
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for stems, out_path in exports:
+            convert_to_coco(
+                args.images,
+                args.labels,
+                out_path,
+                stems,
+                executor=executor,
+                index=index,
+                label_index=label_index,
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -12,6 +12,7 @@ Usage:
 """
 
 import argparse
+import os
 import random
 from pathlib import Path
 from typing import List, Sequence, Tuple
@@ -24,10 +25,20 @@ def _collect_image_stems(images_dir: Path) -> List[str]:
         images_dir: Directory containing image files.
 
     Returns:
-        Sorted list of basenames without extension for files with .jpg.
+        Sorted list of basenames without extension for files with .jpg. Empty
+        if the directory does not exist.
     """
 
-    stems = [p.stem for p in images_dir.glob("*.jpg")]
+    # normcase keeps the suffix match case-insensitive on Windows, like Path.glob
+    try:
+        with os.scandir(images_dir) as entries:
+            stems = [
+                entry.name[:-4]
+                for entry in entries
+                if os.path.normcase(entry.name).endswith(".jpg")
+            ]
+    except FileNotFoundError:
+        return []
     return sorted(stems)
 
 
@@ -71,7 +82,10 @@ def _write_list(path: Path, rows: Sequence[str]) -> None:
     """
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    with path.open("w", encoding="utf-8") as fp:
+        if not rows:
+            fp.write("\n")  # same as "\n".join([]) + "\n"
+        fp.writelines(f"{row}\n" for row in rows)
 
 
 def main() -> None: